@@ -297,7 +297,8 @@ export async function GET(request: NextRequest) {
     // Generate backup data
     console.log('Generating backup data...');
     const backupData = await generateBackupData();
-    const jsonString = JSON.stringify(backupData, null, 2);
+    // Compact output, same as the manual export - indentation roughly doubles file size and encode time
+    const jsonString = JSON.stringify(backupData);
 
     // Calculate file size
     const fileSizeBytes = Buffer.byteLength(jsonString, 'utf8');
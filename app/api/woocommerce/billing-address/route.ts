@@ -1,7 +1,7 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { prisma } from '@/lib/prisma';
 import { validateApiKey } from '@/lib/middleware';
-import { normalizeApiUrl, buildAuthHeaders, getCustomerByEmailCached } from '@/lib/woocommerce-helpers';
+import { normalizeApiUrl, buildAuthHeaders, getCustomerByEmailCached, WOOCOMMERCE_DEADLINE_MS, WOOCOMMERCE_TIMEOUT_ERROR } from '@/lib/woocommerce-helpers';
 
 // Cache settings for 5 minutes to reduce database queries
 let cachedSettings: any = null;
@@ -103,9 +103,12 @@ export async function GET(request: NextRequest) {
       // Build auth headers using shared helper
       const authHeaders = buildAuthHeaders(settings.woocommerceApiKey, settings.woocommerceApiSecret);
 
+      // All WooCommerce calls made for this request share one time budget
+      const deadline = startTime + WOOCOMMERCE_DEADLINE_MS;
+
       // OPTIMIZED: Use shared helper with fallback (tries customer API first, then orders/subscriptions)
       console.log(`[Billing Address API] Looking up customer by email: ${email}`);
-      const customer = await getCustomerByEmailCached(apiUrl, authHeaders, email);
+      const customer = await getCustomerByEmailCached(apiUrl, authHeaders, email, deadline);
 
       // If customer still not found, return empty billing address
       if (!customer) {
@@ -169,6 +172,14 @@ export async function GET(request: NextRequest) {
       responseData = await fetchBillingAddressFromWooCommerce(normalizedEmail);
     } catch (error: any) {
       console.error('Failed to fetch billing address from WooCommerce:', error);
+
+      if (error.message === WOOCOMMERCE_TIMEOUT_ERROR) {
+        return NextResponse.json(
+          { error: WOOCOMMERCE_TIMEOUT_ERROR },
+          { status: 504 }
+        );
+      }
+
       return NextResponse.json(
         {
           error: 'Failed to fetch billing address from WooCommerce',
@@ -311,8 +322,7 @@ export async function PUT(request: NextRequest) {
           const isCreateJson = createContentType && createContentType.includes('application/json');
           
           if (isCreateJson) {
-            const createText = await createResponse.text();
-            const createdCustomer = JSON.parse(createText);
+            const createdCustomer = await createResponse.json();
             customer = createdCustomer;
             customerId = createdCustomer?.id ?? null;
             console.log(`Created new customer with ID ${customerId} for email ${normalizedEmail}`);
@@ -429,7 +439,6 @@ export async function PUT(request: NextRequest) {
     // Parse updated customer data
     let updatedCustomer;
     try {
-      const updateText = await updateResponse.text();
       if (!isUpdateJson) {
         return NextResponse.json(
           {
@@ -441,7 +450,7 @@ export async function PUT(request: NextRequest) {
           { status: 500 }
         );
       }
-      updatedCustomer = JSON.parse(updateText);
+      updatedCustomer = await updateResponse.json();
     } catch (parseError) {
       console.error('Failed to parse update response:', parseError);
       return NextResponse.json(
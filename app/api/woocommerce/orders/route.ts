@@ -2,13 +2,17 @@ import { NextRequest, NextResponse } from 'next/server';
 import { prisma } from '@/lib/prisma';
 import { validateApiKey } from '@/lib/middleware';
 import { filterFieldsArray, parseFieldsParam } from '@/lib/field-filter';
-import { normalizeApiUrl, buildAuthHeaders, getCustomerByEmailCached } from '@/lib/woocommerce-helpers';
+import { normalizeApiUrl, buildAuthHeaders, getCustomerIdByEmailCached, validateCachedCustomerId, fetchFromWooCommerce, fetchAllPages, readJsonResponse, mapWithConcurrency, WOOCOMMERCE_FETCH_CONCURRENCY, recordBelongsToEmail, searchRecordsByEmail, WOOCOMMERCE_DEADLINE_MS, WOOCOMMERCE_TIMEOUT_ERROR } from '@/lib/woocommerce-helpers';
 
 // Cache settings for 5 minutes to reduce database queries
 let cachedSettings: any = null;
 let settingsCacheTime = 0;
 const SETTINGS_CACHE_TTL = 5 * 60 * 1000; // 5 minutes
 
+// Each order fetches its notes separately, so cap the order list at the
+// most recent 100 (one page) to keep the notes fan-out within the deadline
+const ORDERS_MAX_PAGES = 1;
+
 /**
  * WooCommerce Orders Endpoint
  * 
@@ -182,78 +186,123 @@ export async function GET(request: NextRequest) {
       // Build auth headers using shared helper
       const authHeaders = buildAuthHeaders(settings.woocommerceApiKey, settings.woocommerceApiSecret);
 
-      // OPTIMIZED: Get customer by email first (server-side filtering)
+      // All WooCommerce calls made for this request share one time budget
+      const deadline = startTime + WOOCOMMERCE_DEADLINE_MS;
+
+      // OPTIMIZED: Get customer ID by email first (server-side filtering)
+      // A cached ID comes straight from the database, so the orders request starts without
+      // waiting on a WooCommerce customer round trip
       console.log(`[Orders API] Looking up customer by email: ${email}`);
-      const customer = await getCustomerByEmailCached(apiUrl, authHeaders, email);
+      const customerLookup = await getCustomerIdByEmailCached(apiUrl, authHeaders, email, deadline);
+      let accountCustomerId = customerLookup.customerId;
 
-      let customerId: number | null = null;
-      let ordersArray: any[] = [];
+      // Fetch orders with customer ID filter (server-side filtering - MUCH faster)
+      const fetchOrdersByCustomer = (id: number) => {
+        const ordersUrl = new URL(`${apiUrl}/orders`);
+        ordersUrl.searchParams.append('customer', id.toString());
+        ordersUrl.searchParams.append('per_page', '100');
+        return fetchAllPages(ordersUrl, authHeaders, { maxPages: ORDERS_MAX_PAGES, deadline });
+      };
 
-      if (!customer) {
-        console.log(`[Orders API] No customer found for email ${email}. Returning empty orders.`);
-        return {
-          success: true,
-          email: email,
-          customerId: null,
-          count: 0,
-          orders: [],
-        };
-      }
+      // STEP 1: Fetch all customer subscriptions to build order->subscription mapping
+      // In WooCommerce Subscriptions, subscription.parent_id points to the parent order
+      const fetchSubscriptionsByCustomer = async (id: number): Promise<any[]> => {
+        const subscriptionsUrl = new URL(`${apiUrl}/subscriptions`);
+        subscriptionsUrl.searchParams.append('customer', id.toString());
+        subscriptionsUrl.searchParams.append('per_page', '100');
 
-      customerId = customer.id;
-      console.log(`[Orders API] Found customer ID ${customerId}. Fetching orders with server-side filter.`);
+        try {
+          const subscriptionsResult = await fetchAllPages(subscriptionsUrl, authHeaders, { deadline });
+          return subscriptionsResult.items;
+        } catch (subError) {
+          console.log(`[Orders API] Could not fetch subscriptions: ${subError}`);
+        }
+        return [];
+      };
 
-      // Fetch orders with customer ID filter (server-side filtering - MUCH faster)
-      const ordersUrl = new URL(`${apiUrl}/orders`);
-      ordersUrl.searchParams.append('customer', customerId.toString());
-      ordersUrl.searchParams.append('per_page', '100');
+      let customerId: number | null = null;
+      let ordersArray: any[] = [];
+      // Subscriptions always belong to a customer account
+      let subscriptionsPromise: Promise<any[]> = Promise.resolve([]);
+
+      if (accountCustomerId !== null) {
+        console.log(`[Orders API] Found customer ID ${accountCustomerId}. Fetching orders with server-side filter.`);
+
+        // Started before the orders request since both only depend on the customer ID
+        subscriptionsPromise = fetchSubscriptionsByCustomer(accountCustomerId);
+        let ordersResult = await fetchOrdersByCustomer(accountCustomerId);
+
+        // A cached ID can outlive the WooCommerce customer (deleted or merged accounts).
+        // If it yields nothing, check it still exists before trusting the empty result.
+        if (customerLookup.fromCache && ordersResult.ok && ordersResult.items.length === 0) {
+          const refreshedCustomerId = await validateCachedCustomerId(apiUrl, authHeaders, email, accountCustomerId, deadline);
+
+          if (refreshedCustomerId !== accountCustomerId) {
+            accountCustomerId = refreshedCustomerId;
+            if (refreshedCustomerId !== null) {
+              console.log(`[Orders API] Customer ID changed to ${refreshedCustomerId}. Fetching orders again.`);
+              subscriptionsPromise = fetchSubscriptionsByCustomer(refreshedCustomerId);
+              ordersResult = await fetchOrdersByCustomer(refreshedCustomerId);
+            }
+          }
+        }
 
-      const woocommerceResponse = await fetch(ordersUrl.toString(), {
-        method: 'GET',
-        headers: authHeaders,
-      });
+        if (accountCustomerId !== null) {
+          if (!ordersResult.ok) {
+            throw new Error(`WooCommerce API returned ${ordersResult.status}`);
+          }
 
-      if (!woocommerceResponse.ok) {
-        throw new Error(`WooCommerce API returned ${woocommerceResponse.status}`);
+          customerId = accountCustomerId;
+          ordersArray = ordersResult.items;
+        }
       }
 
-      // Parse JSON response
-      const contentType = woocommerceResponse.headers.get('content-type');
-      const isJson = contentType && contentType.includes('application/json');
-
-      if (!isJson) {
-        throw new Error('WooCommerce API returned invalid response format');
-      }
+      if (accountCustomerId === null) {
+        // No customer account matched - fall back to a server-side search so guest orders
+        // (or accounts registered under a different email) are still found
+        console.log(`[Orders API] No customer found for email ${email}. Searching orders by email.`);
+        const searchResult = await searchRecordsByEmail(`${apiUrl}/orders`, authHeaders, email, { maxPages: ORDERS_MAX_PAGES, deadline });
 
-      const orders = await woocommerceResponse.json();
-      ordersArray = Array.isArray(orders) ? orders : [orders];
+        if (!searchResult.ok) {
+          throw new Error(`WooCommerce API returned ${searchResult.status}`);
+        }
 
-      console.log(`[Orders API] Found ${ordersArray.length} orders for customer ID ${customerId}`);
+        ordersArray = searchResult.items;
 
-      // STEP 1: Fetch all customer subscriptions to build order->subscription mapping
-      // In WooCommerce Subscriptions, subscription.parent_id points to the parent order
-      const subscriptionsUrl = new URL(`${apiUrl}/subscriptions`);
-      subscriptionsUrl.searchParams.append('customer', customerId.toString());
-      subscriptionsUrl.searchParams.append('per_page', '100');
-
-      let subscriptionsArray: any[] = [];
-      try {
-        const subscriptionsResponse = await fetch(subscriptionsUrl.toString(), {
-          method: 'GET',
-          headers: authHeaders,
-        });
+        if (ordersArray.length === 0) {
+          console.log(`[Orders API] No orders found for email ${email}. Returning empty orders.`);
+          return {
+            success: true,
+            email: email,
+            customerId: null,
+            count: 0,
+            orders: [],
+          };
+        }
 
-        if (subscriptionsResponse.ok) {
-          const subContentType = subscriptionsResponse.headers.get('content-type');
-          if (subContentType && subContentType.includes('application/json')) {
-            const subs = await subscriptionsResponse.json();
-            subscriptionsArray = Array.isArray(subs) ? subs : [subs];
-          }
+        // Orders placed while logged in carry the account's customer ID
+        const accountOrder = ordersArray.find((order: any) => order.customer_id > 0);
+        customerId = accountOrder ? accountOrder.customer_id : null;
+        if (customerId !== null) {
+          subscriptionsPromise = fetchSubscriptionsByCustomer(customerId);
         }
-      } catch (subError) {
-        console.log(`[Orders API] Could not fetch subscriptions: ${subError}`);
       }
 
+      console.log(`[Orders API] Found ${ordersArray.length} orders for email ${email}`);
+
+      // Keep only the subscription fields used for order relationships below,
+      // so the full subscription payloads can be released early
+      const subscriptionsArray = (await subscriptionsPromise).map((sub: any) => ({
+        id: sub.id,
+        parent_id: sub.parent_id,
+        number: sub.number,
+        status: sub.status,
+        date_created: sub.date_created,
+        date_created_gmt: sub.date_created_gmt,
+        total: sub.total,
+        billing_period: sub.billing_period,
+      }));
+
       console.log(`[Orders API] Found ${subscriptionsArray.length} subscriptions for customer`);
 
       // Build maps: 
@@ -292,50 +341,46 @@ export async function GET(request: NextRequest) {
         }
       });
 
-      // STEP 3: Fetch all unique products in parallel
+      // STEPS 3-5 only depend on the orders and subscriptions fetched above, so they
+      // run concurrently; each fan-out is capped to avoid flooding the WooCommerce host
       const uniqueProductIds = [...new Set(allProductIds)];
-      const productsMap = new Map<number, any>();
+      // Only the first image URL of each product is used, so keep just that
+      const productImagesMap = new Map<number, string | null>();
+      const subscriptionOrdersMap: Map<number, number[]> = new Map();
+      const orderTrackingMap = new Map<number, Array<{
+        tracking_number: string;
+        carrier: string;
+        ship_date: string | null;
+      }>>();
 
-      await Promise.all(
-        uniqueProductIds.map(async (productId) => {
+      await Promise.all([
+        // STEP 3: Fetch all unique products in parallel
+        mapWithConcurrency(uniqueProductIds, WOOCOMMERCE_FETCH_CONCURRENCY, async (productId) => {
           try {
             const productUrl = `${apiUrl}/products/${productId}`;
-            const productResponse = await fetch(productUrl, {
-              method: 'GET',
-              headers: authHeaders,
-            });
+            const productResponse = await fetchFromWooCommerce(productUrl, authHeaders, deadline);
 
             if (productResponse.ok) {
-              const productContentType = productResponse.headers.get('content-type');
-              if (productContentType && productContentType.includes('application/json')) {
-                const product = await productResponse.json();
-                productsMap.set(productId, product);
+              const product = await readJsonResponse(productResponse);
+              if (product !== null) {
+                productImagesMap.set(productId, product.images?.[0]?.src || null);
               }
             }
           } catch (productError) {
             // Continue without product - will use default values
           }
-        })
-      );
+        }),
 
-      // STEP 4: Build subscription-to-orders mapping for related_orders
-      // Fetch related orders from each subscription's orders endpoint
-      const subscriptionOrdersMap: Map<number, number[]> = new Map();
-      
-      // For each subscription, get its related orders
-      await Promise.all(
-        subscriptionsArray.map(async (sub: any) => {
+        // STEP 4: Build subscription-to-orders mapping for related_orders
+        // Fetch related orders from each subscription's orders endpoint
+        mapWithConcurrency(subscriptionsArray, WOOCOMMERCE_FETCH_CONCURRENCY, async (sub: any) => {
           try {
             const subOrdersUrl = `${apiUrl}/subscriptions/${sub.id}/orders`;
-            const subOrdersResponse = await fetch(subOrdersUrl, {
-              method: 'GET',
-              headers: authHeaders,
-            });
+            const subOrdersResponse = await fetchFromWooCommerce(subOrdersUrl, authHeaders, deadline);
 
             if (subOrdersResponse.ok) {
-              const contentType = subOrdersResponse.headers.get('content-type');
-              if (contentType && contentType.includes('application/json')) {
-                const subOrders = await subOrdersResponse.json();
+              const subOrders = await readJsonResponse(subOrdersResponse);
+              if (subOrders !== null) {
                 const orderIds = Array.isArray(subOrders) 
                   ? subOrders.map((o: any) => o.id) 
                   : [subOrders.id];
@@ -345,29 +390,17 @@ export async function GET(request: NextRequest) {
           } catch (err) {
             // Continue without subscription orders
           }
-        })
-      );
+        }),
 
-      // STEP 5: Fetch order notes in parallel to extract tracking numbers
-      const orderTrackingMap = new Map<number, Array<{
-        tracking_number: string;
-        carrier: string;
-        ship_date: string | null;
-      }>>();
-
-      await Promise.all(
-        ordersArray.map(async (order: any) => {
+        // STEP 5: Fetch order notes in parallel to extract tracking numbers
+        mapWithConcurrency(ordersArray, WOOCOMMERCE_FETCH_CONCURRENCY, async (order: any) => {
           try {
             const notesUrl = `${apiUrl}/orders/${order.id}/notes`;
-            const notesResponse = await fetch(notesUrl, {
-              method: 'GET',
-              headers: authHeaders,
-            });
+            const notesResponse = await fetchFromWooCommerce(notesUrl, authHeaders, deadline);
 
             if (notesResponse.ok) {
-              const notesContentType = notesResponse.headers.get('content-type');
-              if (notesContentType && notesContentType.includes('application/json')) {
-                const notes = await notesResponse.json();
+              const notes = await readJsonResponse(notesResponse);
+              if (notes !== null) {
                 const notesArray = Array.isArray(notes) ? notes : [notes];
 
                 const trackingEntries: Array<{
@@ -395,8 +428,14 @@ export async function GET(request: NextRequest) {
             // Continue without notes - tracking will be empty for this order
             console.log(`[Orders API] Could not fetch notes for order ${order.id}: ${notesError}`);
           }
-        })
-      );
+        }),
+      ]);
+
+      // The fan-outs skip anything they could not fetch; if that was because the
+      // deadline passed, report a timeout instead of returning partial data
+      if (Date.now() >= deadline) {
+        throw new Error(WOOCOMMERCE_TIMEOUT_ERROR);
+      }
 
       console.log(`[Orders API] Extracted tracking info for ${orderTrackingMap.size} orders`);
 
@@ -422,15 +461,8 @@ export async function GET(request: NextRequest) {
 
         // Transform line items with required fields
         const transformedLineItems = (order.line_items || []).map((item: any) => {
-          let imageSrc = null;
-
           // Get product image from cache (if available)
-          if (item.product_id && productsMap.has(item.product_id)) {
-            const product = productsMap.get(item.product_id);
-            if (product.images && product.images.length > 0) {
-              imageSrc = product.images[0].src || null;
-            }
-          }
+          const imageSrc = (item.product_id && productImagesMap.get(item.product_id)) || null;
 
           return {
             id: item.id,
@@ -603,6 +635,13 @@ export async function GET(request: NextRequest) {
     } catch (error: any) {
       console.error('Failed to fetch orders from WooCommerce:', error);
       
+      if (error.message === WOOCOMMERCE_TIMEOUT_ERROR) {
+        return NextResponse.json(
+          { error: WOOCOMMERCE_TIMEOUT_ERROR },
+          { status: 504 }
+        );
+      }
+
       return NextResponse.json(
         {
           error: 'Failed to fetch orders from WooCommerce',
@@ -801,7 +840,6 @@ export async function POST(request: NextRequest) {
     // Parse order data
     let order;
     try {
-      const orderText = await orderResponse.text();
       if (!isOrderJson) {
         return NextResponse.json(
           {
@@ -813,7 +851,7 @@ export async function POST(request: NextRequest) {
           { status: 500 }
         );
       }
-      order = JSON.parse(orderText);
+      order = await orderResponse.json();
     } catch (parseError) {
       console.error('Failed to parse order response:', parseError);
       return NextResponse.json(
@@ -828,8 +866,7 @@ export async function POST(request: NextRequest) {
     }
 
     // Verify the order belongs to the user
-    const orderEmail = order.billing?.email?.toLowerCase().trim() || order.customer_email?.toLowerCase().trim();
-    if (orderEmail !== normalizedEmail) {
+    if (!recordBelongsToEmail(order, normalizedEmail)) {
       return NextResponse.json(
         { error: 'Order does not belong to this user' },
         { status: 403 }
@@ -895,7 +932,6 @@ export async function POST(request: NextRequest) {
     // Parse cancelled order response
     let cancelledOrder;
     try {
-      const cancelText = await cancelResponse.text();
       if (!isCancelJson) {
         return NextResponse.json(
           {
@@ -907,7 +943,7 @@ export async function POST(request: NextRequest) {
           { status: 500 }
         );
       }
-      cancelledOrder = JSON.parse(cancelText);
+      cancelledOrder = await cancelResponse.json();
     } catch (parseError) {
       console.error('Failed to parse cancel order response:', parseError);
       return NextResponse.json(
@@ -1,6 +1,7 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { prisma } from '@/lib/prisma';
 import { validateApiKey } from '@/lib/middleware';
+import { recordBelongsToEmail } from '@/lib/woocommerce-helpers';
 
 // Cache settings for 5 minutes to reduce database queries
 let cachedSettings: {
@@ -156,9 +157,7 @@ export async function GET(request: NextRequest) {
       }
 
       const order = await orderResponse.json();
-      const orderEmail = order.billing?.email?.toLowerCase().trim() || order.customer_email?.toLowerCase().trim();
-
-      if (orderEmail !== normalizedEmail) {
+      if (!recordBelongsToEmail(order, normalizedEmail)) {
         return NextResponse.json(
           { error: 'Order does not belong to this user' },
           { status: 403 }
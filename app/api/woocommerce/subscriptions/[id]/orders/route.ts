@@ -2,6 +2,7 @@ import { NextRequest, NextResponse } from 'next/server';
 import { prisma } from '@/lib/prisma';
 import { validateApiKey } from '@/lib/middleware';
 import { filterFieldsArray, parseFieldsParam } from '@/lib/field-filter';
+import { normalizeApiUrl, buildAuthHeaders, fetchFromWooCommerce, readJsonResponse, mapWithConcurrency, WOOCOMMERCE_FETCH_CONCURRENCY, recordBelongsToEmail, WOOCOMMERCE_DEADLINE_MS, WOOCOMMERCE_TIMEOUT_ERROR } from '@/lib/woocommerce-helpers';
 
 // Cache settings for 5 minutes to reduce database queries
 let cachedSettings: any = null;
@@ -126,9 +127,9 @@ export async function GET(
       return subscription.parent_id && order.id !== subscription.parent_id ? 'renewal' : 'unknown';
     }
 
-    // Helper function to enrich order with product details using cached products
+    // Helper function to enrich order with product details using cached product images
     // Returns required fields per API_PAYLOAD_REQUIREMENTS.md
-    function enrichOrderWithProducts(order: any, productsMap: Map<number, any>) {
+    function enrichOrderWithProducts(order: any, productImagesMap: Map<number, string | null>) {
       // Filter meta_data to include:
       // 1. Tracking-related entries
       // 2. Medication schedule ACF fields (without underscore prefix - these contain actual values)
@@ -152,15 +153,8 @@ export async function GET(
 
       // Transform line items to only include required fields
       const transformedLineItems = (order.line_items || []).map((item: any) => {
-        let imageSrc = null;
-
         // Get product image from cache (if available)
-        if (item.product_id && productsMap.has(item.product_id)) {
-          const product = productsMap.get(item.product_id);
-          if (product.images && product.images.length > 0) {
-            imageSrc = product.images[0].src || null;
-          }
-        }
+        const imageSrc = (item.product_id && productImagesMap.get(item.product_id)) || null;
 
         return {
           name: item.name || 'Unknown Product',
@@ -192,41 +186,24 @@ export async function GET(
         throw new Error('WooCommerce API credentials are not configured');
       }
 
-      // Prepare WooCommerce API URL
-      let apiUrl = settings.woocommerceApiUrl.replace(/\/$/, '');
-      
-      if (!apiUrl.includes('/wp-json/wc/')) {
-        const baseUrl = apiUrl.replace(/\/wp-json.*$/, '');
-        apiUrl = `${baseUrl}/wp-json/wc/v3`;
-      }
-      
-      if (!apiUrl.includes('/wp-json/wc/')) {
-        throw new Error('Invalid WooCommerce API URL format');
-      }
+      // Normalize API URL using shared helper
+      const apiUrl = normalizeApiUrl(settings.woocommerceApiUrl);
 
-      // Create Basic Auth header
-      const authString = Buffer.from(`${settings.woocommerceApiKey}:${settings.woocommerceApiSecret}`).toString('base64');
-      const authHeaders = {
-        'Authorization': `Basic ${authString}`,
-        'Content-Type': 'application/json',
-        'Accept': 'application/json',
-      };
+      // Build auth headers using shared helper
+      const authHeaders = buildAuthHeaders(settings.woocommerceApiKey, settings.woocommerceApiSecret);
+
+      // All WooCommerce calls made for this request share one time budget
+      const deadline = startTime + WOOCOMMERCE_DEADLINE_MS;
 
       // First, fetch and verify the subscription exists and belongs to the user
       let subscriptionUrl = `${apiUrl}/subscriptions/${subscriptionId}`;
-      let subscriptionResponse = await fetch(subscriptionUrl, {
-        method: 'GET',
-        headers: authHeaders,
-      });
+      let subscriptionResponse = await fetchFromWooCommerce(subscriptionUrl, authHeaders, deadline);
 
       // If v3 doesn't work, try v1
       if (!subscriptionResponse.ok && subscriptionResponse.status === 404) {
         const apiUrlV1 = apiUrl.replace('/wc/v3', '/wc/v1');
         subscriptionUrl = `${apiUrlV1}/subscriptions/${subscriptionId}`;
-        subscriptionResponse = await fetch(subscriptionUrl, {
-          method: 'GET',
-          headers: authHeaders,
-        });
+        subscriptionResponse = await fetchFromWooCommerce(subscriptionUrl, authHeaders, deadline);
       }
 
       // Check if response is JSON
@@ -250,41 +227,29 @@ export async function GET(
       // Parse subscription data
       let subscription;
       try {
-        const subscriptionText = await subscriptionResponse.text();
         if (!isSubscriptionJson) {
           throw new Error('WooCommerce API returned an invalid response format');
         }
-        subscription = JSON.parse(subscriptionText);
+        subscription = await subscriptionResponse.json();
       } catch (parseError) {
         console.error('Failed to parse subscription response:', parseError);
         throw new Error('Failed to parse response from WooCommerce API');
       }
 
       // Verify the subscription belongs to the user
-      const subscriptionEmail = (
-        subscription.billing?.email?.toLowerCase().trim() ||
-        subscription.customer_email?.toLowerCase().trim() ||
-        ''
-      );
-      if (subscriptionEmail !== email) {
+      if (!recordBelongsToEmail(subscription, email)) {
         throw new Error('Subscription does not belong to this user');
       }
 
       // Fetch orders for the subscription using primary method
       let ordersUrl = `${apiUrl}/subscriptions/${subscriptionId}/orders`;
-      let ordersResponse = await fetch(ordersUrl, {
-        method: 'GET',
-        headers: authHeaders,
-      });
+      let ordersResponse = await fetchFromWooCommerce(ordersUrl, authHeaders, deadline);
 
       // If v3 endpoint returns 404, try v1 endpoint
       if (!ordersResponse.ok && ordersResponse.status === 404) {
         const apiUrlV1 = apiUrl.replace('/wc/v3', '/wc/v1');
         ordersUrl = `${apiUrlV1}/subscriptions/${subscriptionId}/orders`;
-        ordersResponse = await fetch(ordersUrl, {
-          method: 'GET',
-          headers: authHeaders,
-        });
+        ordersResponse = await fetchFromWooCommerce(ordersUrl, authHeaders, deadline);
       }
 
       if (!ordersResponse.ok) {
@@ -315,14 +280,12 @@ export async function GET(
       }
 
       // Parse JSON response
-      const contentType = ordersResponse.headers.get('content-type');
-      const isJson = contentType && contentType.includes('application/json');
-      
-      if (!isJson) {
+      const orders = await readJsonResponse(ordersResponse);
+
+      if (orders === null) {
         throw new Error('WooCommerce API returned invalid response format');
       }
 
-      const orders = await ordersResponse.json();
       const ordersArray = Array.isArray(orders) ? orders : [orders];
 
       // STEP 1: Collect all unique product_ids from all orders
@@ -341,32 +304,33 @@ export async function GET(
       const uniqueProductIds = [...new Set(allProductIds)];
 
       // STEP 3: Fetch all unique products in parallel
-      const productsMap = new Map<number, any>();
-      await Promise.all(
-        uniqueProductIds.map(async (productId) => {
-          try {
-            const productUrl = `${apiUrl}/products/${productId}`;
-            const productResponse = await fetch(productUrl, {
-              method: 'GET',
-              headers: authHeaders,
-            });
-
-            if (productResponse.ok) {
-              const productContentType = productResponse.headers.get('content-type');
-              if (productContentType && productContentType.includes('application/json')) {
-                const product = await productResponse.json();
-                productsMap.set(productId, product);
-              }
+      // Only the first image URL of each product is used, so keep just that
+      const productImagesMap = new Map<number, string | null>();
+      await mapWithConcurrency(uniqueProductIds, WOOCOMMERCE_FETCH_CONCURRENCY, async (productId) => {
+        try {
+          const productUrl = `${apiUrl}/products/${productId}`;
+          const productResponse = await fetchFromWooCommerce(productUrl, authHeaders, deadline);
+
+          if (productResponse.ok) {
+            const product = await readJsonResponse(productResponse);
+            if (product !== null) {
+              productImagesMap.set(productId, product.images?.[0]?.src || null);
             }
-          } catch (productError) {
-            // Continue without product - will use default values
           }
-        })
-      );
+        } catch (productError) {
+          // Continue without product - will use default values
+        }
+      });
 
-      // STEP 4: Enrich orders using the cached productsMap
+      // The fan-out skips products it could not fetch; if that was because the
+      // deadline passed, report a timeout instead of returning partial data
+      if (Date.now() >= deadline) {
+        throw new Error(WOOCOMMERCE_TIMEOUT_ERROR);
+      }
+
+      // STEP 4: Enrich orders using the cached productImagesMap
       const enrichedOrders = ordersArray.map((order: any) => {
-        const enrichedOrder = enrichOrderWithProducts(order, productsMap);
+        const enrichedOrder = enrichOrderWithProducts(order, productImagesMap);
         
         // Determine order type
         enrichedOrder.type = determineOrderType(order, subscription);
@@ -419,6 +383,13 @@ export async function GET(
     } catch (error: any) {
       console.error('Failed to fetch subscription orders from WooCommerce:', error);
       
+      if (error.message === WOOCOMMERCE_TIMEOUT_ERROR) {
+        return NextResponse.json(
+          { error: WOOCOMMERCE_TIMEOUT_ERROR },
+          { status: 504 }
+        );
+      }
+
       if (error.message === 'Subscription not found') {
         return NextResponse.json(
           { error: 'Subscription not found' },
@@ -1,7 +1,7 @@
 import { NextRequest, NextResponse } from 'next/server';
 import { prisma } from '@/lib/prisma';
 import { validateApiKey } from '@/lib/middleware';
-import { normalizeApiUrl, buildAuthHeaders, getCustomerByEmailCached } from '@/lib/woocommerce-helpers';
+import { normalizeApiUrl, buildAuthHeaders, getCustomerByEmailCached, recordBelongsToEmail } from '@/lib/woocommerce-helpers';
 
 // Cache settings for 5 minutes to reduce database queries
 let cachedSettings: any = null;
@@ -167,13 +167,7 @@ export async function GET(
     const subscription = await subscriptionResponse.json();
 
     // Verify subscription belongs to the user
-    const subscriptionEmail = (
-      subscription.billing?.email?.toLowerCase().trim() ||
-      subscription.customer_email?.toLowerCase().trim() ||
-      ''
-    );
-
-    if (subscriptionEmail !== normalizedEmail) {
+    if (!recordBelongsToEmail(subscription, normalizedEmail)) {
       return NextResponse.json(
         { error: 'Subscription does not belong to this user' },
         { status: 403 }
@@ -2,7 +2,7 @@ import { NextRequest, NextResponse } from 'next/server';
 import { prisma } from '@/lib/prisma';
 import { validateApiKey } from '@/lib/middleware';
 import { filterFieldsArray, parseFieldsParam } from '@/lib/field-filter';
-import { normalizeApiUrl, buildAuthHeaders, getCustomerByEmailCached } from '@/lib/woocommerce-helpers';
+import { normalizeApiUrl, buildAuthHeaders, getCustomerIdByEmailCached, validateCachedCustomerId, fetchAllPages, recordBelongsToEmail, searchRecordsByEmail, WOOCOMMERCE_DEADLINE_MS, WOOCOMMERCE_TIMEOUT_ERROR, PaginatedResult } from '@/lib/woocommerce-helpers';
 
 // Cache settings for 5 minutes to reduce database queries
 let cachedSettings: any = null;
@@ -94,130 +94,111 @@ export async function GET(request: NextRequest) {
       // Build auth headers using shared helper
       const authHeaders = buildAuthHeaders(settings.woocommerceApiKey, settings.woocommerceApiSecret);
 
-      // OPTIMIZED: Get customer by email first (server-side filtering)
-      // Use fallback method that also searches orders/subscriptions if customer not found directly
+      // All WooCommerce calls made for this request share one time budget
+      const deadline = startTime + WOOCOMMERCE_DEADLINE_MS;
+
+      // OPTIMIZED: Get customer ID by email first (server-side filtering)
+      // A cached ID comes straight from the database, skipping a WooCommerce customer round trip
+      // Falls back to searching subscriptions by email if no customer is found
       console.log(`[Subscriptions API] Looking up customer by email: ${email}`);
-      const customer = await getCustomerByEmailCached(apiUrl, authHeaders, email);
+      const customerLookup = await getCustomerIdByEmailCached(apiUrl, authHeaders, email, deadline);
+      let accountCustomerId = customerLookup.customerId;
 
       let subscriptionsArray: any[] = [];
       let customerId: number | null = null;
 
-      if (!customer) {
-        console.log(`[Subscriptions API] No customer found for email ${email}. Returning empty subscriptions.`);
-        // Return empty result - no customer means no subscriptions
-        return {
-          success: true,
-          email: email,
-          customerId: null,
-          count: 0,
-          subscriptions: [],
-        };
-      }
-
-      customerId = customer.id;
-      console.log(`[Subscriptions API] Found customer ID ${customerId}. Fetching subscriptions with server-side filter.`);
-
       // Helper function to fetch subscriptions by customer ID with pagination
-      async function fetchSubscriptionsByCustomer(customerId: number): Promise<any[]> {
-        let allSubscriptions: any[] = [];
-        let currentPage = 1;
-        let totalPages = 1;
-        let apiUrlToUse = apiUrl;
-        let isV1Endpoint = false;
-
+      async function fetchSubscriptionsByCustomer(customerId: number) {
         // Fetch subscriptions with customer ID filter (server-side filtering)
-        do {
-          let subscriptionsUrl: URL;
-          let woocommerceResponse: Response;
-
-          subscriptionsUrl = new URL(`${apiUrlToUse}/subscriptions`);
+        const buildSubscriptionsUrl = (baseUrl: string) => {
+          const subscriptionsUrl = new URL(`${baseUrl}/subscriptions`);
           subscriptionsUrl.searchParams.append('per_page', '100');
-          subscriptionsUrl.searchParams.append('page', currentPage.toString());
           // Server-side filter by customer ID - this is the KEY optimization
           subscriptionsUrl.searchParams.append('customer', customerId.toString());
+          return subscriptionsUrl;
+        };
 
-          woocommerceResponse = await fetch(subscriptionsUrl.toString(), {
-            method: 'GET',
-            headers: authHeaders,
-          });
-
-          // If v3 endpoint doesn't work on first page, try v1 endpoint
-          if (!woocommerceResponse.ok && woocommerceResponse.status === 404 && currentPage === 1 && !isV1Endpoint) {
-            apiUrlToUse = apiUrl.replace('/wc/v3', '/wc/v1');
-            isV1Endpoint = true;
-            subscriptionsUrl = new URL(`${apiUrlToUse}/subscriptions`);
-            subscriptionsUrl.searchParams.append('per_page', '100');
-            subscriptionsUrl.searchParams.append('page', currentPage.toString());
-            subscriptionsUrl.searchParams.append('customer', customerId.toString());
-
-            woocommerceResponse = await fetch(subscriptionsUrl.toString(), {
-              method: 'GET',
-              headers: authHeaders,
-            });
-          }
+        let result = await fetchAllPages(buildSubscriptionsUrl(apiUrl), authHeaders, { deadline });
 
-          if (!woocommerceResponse.ok) {
-            if (woocommerceResponse.status === 404 && currentPage === 1) {
-              throw new Error('WooCommerce Subscriptions plugin not found or not active');
-            }
-            // If we get an error on a later page, break the loop (might be end of pages)
-            if (currentPage > 1) {
-              break;
-            }
-            throw new Error(`WooCommerce API returned ${woocommerceResponse.status}`);
-          }
+        // If v3 endpoint doesn't work, try v1 endpoint
+        if (!result.ok && result.status === 404) {
+          result = await fetchAllPages(buildSubscriptionsUrl(apiUrl.replace('/wc/v3', '/wc/v1')), authHeaders, { deadline });
+        }
 
-          // Parse JSON response
-          const contentType = woocommerceResponse.headers.get('content-type');
-          const isJson = contentType && contentType.includes('application/json');
+        return result;
+      }
 
-          if (!isJson) {
-            throw new Error('WooCommerce API returned invalid response format');
-          }
+      // Helper function to search subscriptions by email, with the same v1 fallback
+      async function searchSubscriptionsByEmail() {
+        let result = await searchRecordsByEmail(`${apiUrl}/subscriptions`, authHeaders, email, { deadline });
 
-          const pageSubscriptions = await woocommerceResponse.json();
-          const pageSubscriptionsArray = Array.isArray(pageSubscriptions) ? pageSubscriptions : [pageSubscriptions];
+        // If v3 endpoint doesn't work, try v1 endpoint
+        if (!result.ok && result.status === 404) {
+          result = await searchRecordsByEmail(`${apiUrl.replace('/wc/v3', '/wc/v1')}/subscriptions`, authHeaders, email, { deadline });
+        }
 
-          // If no subscriptions on this page, we're done
-          if (pageSubscriptionsArray.length === 0) {
-            break;
+        return result;
+      }
+
+      // Helper function to turn a failed subscriptions response into the matching error
+      function getSubscriptionItems(result: PaginatedResult): any[] {
+        if (!result.ok) {
+          if (result.status === 404) {
+            throw new Error('WooCommerce Subscriptions plugin not found or not active');
           }
+          throw new Error(`WooCommerce API returned ${result.status}`);
+        }
 
-          // Add subscriptions from this page to our collection
-          allSubscriptions = allSubscriptions.concat(pageSubscriptionsArray);
+        return result.items;
+      }
 
-          // Get pagination info from headers
-          const totalPagesHeader = woocommerceResponse.headers.get('X-WP-TotalPages');
-          if (totalPagesHeader) {
-            const parsedTotalPages = parseInt(totalPagesHeader, 10);
-            if (!isNaN(parsedTotalPages) && parsedTotalPages > totalPages) {
-              totalPages = parsedTotalPages;
-            }
-          }
+      if (accountCustomerId !== null) {
+        console.log(`[Subscriptions API] Found customer ID ${accountCustomerId}. Fetching subscriptions with server-side filter.`);
 
-          // Move to next page
-          currentPage++;
+        // Fetch subscriptions using customer ID (server-side filtering - MUCH faster)
+        let result = await fetchSubscriptionsByCustomer(accountCustomerId);
 
-          // With customer filter, we expect very few subscriptions per customer
-          // Still keep safety limit but much less likely to hit it
-          if (currentPage > 3) {
-            console.warn('[Subscriptions API] Reached 3 pages of subscriptions for single customer (300+ subscriptions). Breaking.');
-            break;
-          }
+        // A cached ID can outlive the WooCommerce customer (deleted or merged accounts).
+        // If it yields nothing, check it still exists before trusting the empty result.
+        if (customerLookup.fromCache && result.ok && result.items.length === 0) {
+          const refreshedCustomerId = await validateCachedCustomerId(apiUrl, authHeaders, email, accountCustomerId, deadline);
 
-          // If we got fewer subscriptions than per_page, we've reached the last page
-          if (pageSubscriptionsArray.length < 100) {
-            break;
+          if (refreshedCustomerId !== accountCustomerId) {
+            accountCustomerId = refreshedCustomerId;
+            if (refreshedCustomerId !== null) {
+              console.log(`[Subscriptions API] Customer ID changed to ${refreshedCustomerId}. Fetching subscriptions again.`);
+              result = await fetchSubscriptionsByCustomer(refreshedCustomerId);
+            }
           }
+        }
 
-        } while (currentPage <= totalPages);
-
-        return allSubscriptions;
+        if (accountCustomerId !== null) {
+          customerId = accountCustomerId;
+          subscriptionsArray = getSubscriptionItems(result);
+          console.log(`[Subscriptions API] Found ${subscriptionsArray.length} subscriptions for customer ID ${customerId}`);
+        }
       }
 
-      // Fetch subscriptions using customer ID (server-side filtering - MUCH faster)
-      subscriptionsArray = await fetchSubscriptionsByCustomer(customerId);
-      console.log(`[Subscriptions API] Found ${subscriptionsArray.length} subscriptions for customer ID ${customerId}`);
+      if (accountCustomerId === null) {
+        // No customer account matched - the account may be registered under a different
+        // email than the billing one, so search subscriptions server-side before giving up
+        console.log(`[Subscriptions API] No customer found for email ${email}. Searching subscriptions by email.`);
+        subscriptionsArray = getSubscriptionItems(await searchSubscriptionsByEmail());
+
+        if (subscriptionsArray.length === 0) {
+          console.log(`[Subscriptions API] No subscriptions found for email ${email}. Returning empty subscriptions.`);
+          return {
+            success: true,
+            email: email,
+            customerId: null,
+            count: 0,
+            subscriptions: [],
+          };
+        }
+
+        customerId = subscriptionsArray[0].customer_id || null;
+        console.log(`[Subscriptions API] Found ${subscriptionsArray.length} subscriptions by email search`);
+      }
 
       // Log subscription details for debugging
       if (subscriptionsArray.length > 0) {
@@ -226,7 +207,7 @@ export async function GET(request: NextRequest) {
           status: sub.status,
           date_created: sub.date_created,
         }));
-        console.log(`[Subscriptions API] Subscriptions:`, JSON.stringify(subscriptionSummary, null, 2));
+        console.log(`[Subscriptions API] Subscriptions:`, JSON.stringify(subscriptionSummary));
       }
 
       // Transform subscriptions to return required fields per API_PAYLOAD_REQUIREMENTS.md
@@ -311,6 +292,13 @@ export async function GET(request: NextRequest) {
     } catch (error: any) {
       console.error('Failed to fetch subscriptions from WooCommerce:', error);
       
+      if (error.message === WOOCOMMERCE_TIMEOUT_ERROR) {
+        return NextResponse.json(
+          { error: WOOCOMMERCE_TIMEOUT_ERROR },
+          { status: 504 }
+        );
+      }
+
       if (error.message === 'WooCommerce Subscriptions plugin not found or not active') {
         return NextResponse.json(
           {
@@ -581,7 +569,6 @@ export async function POST(request: NextRequest) {
     // Parse subscription data
     let subscription;
     try {
-      const subscriptionText = await subscriptionResponse.text();
       if (!isSubscriptionJson) {
         return NextResponse.json(
           {
@@ -593,7 +580,7 @@ export async function POST(request: NextRequest) {
           { status: 500 }
         );
       }
-      subscription = JSON.parse(subscriptionText);
+      subscription = await subscriptionResponse.json();
     } catch (parseError) {
       console.error('Failed to parse subscription response:', parseError);
       return NextResponse.json(
@@ -608,12 +595,7 @@ export async function POST(request: NextRequest) {
     }
 
     // Verify the subscription belongs to the user
-    const subscriptionEmail = (
-      subscription.billing?.email?.toLowerCase().trim() ||
-      subscription.customer_email?.toLowerCase().trim() ||
-      ''
-    );
-    if (subscriptionEmail !== normalizedEmail) {
+    if (!recordBelongsToEmail(subscription, normalizedEmail)) {
       return NextResponse.json(
         { error: 'Subscription does not belong to this user' },
         { status: 403 }
@@ -778,7 +760,6 @@ export async function POST(request: NextRequest) {
     // Parse updated subscription response
     let updatedSubscription;
     try {
-      const updateText = await updateResponse.text();
       if (!isUpdateJson) {
         return NextResponse.json(
           {
@@ -790,7 +771,7 @@ export async function POST(request: NextRequest) {
           { status: 500 }
         );
       }
-      updatedSubscription = JSON.parse(updateText);
+      updatedSubscription = await updateResponse.json();
     } catch (parseError) {
       console.error('Failed to parse update subscription response:', parseError);
       return NextResponse.json(
@@ -76,6 +76,294 @@ export function buildAuthHeaders(apiKey: string, apiSecret: string): HeadersInit
   };
 }
 
+// Transient WooCommerce responses worth retrying (rate limiting and gateway/server errors)
+// Auth failures and missing resources (401/403/404) are returned to the caller immediately
+const RETRYABLE_STATUSES = new Set([429, 500, 502, 503, 504]);
+const MAX_RETRIES = 3;
+const RETRY_BASE_DELAY_MS = 500;
+const RETRY_MAX_DELAY_MS = 5000;
+
+// Upper bound for a single WooCommerce request (connect + full response)
+const REQUEST_TIMEOUT_MS = 20 * 1000; // 20 seconds
+
+/**
+ * Time budget for all WooCommerce calls made while serving one API request
+ * Routes compute `startTime + WOOCOMMERCE_DEADLINE_MS` and pass it down as the deadline
+ */
+export const WOOCOMMERCE_DEADLINE_MS = 25 * 1000; // 25 seconds
+
+/**
+ * Error message thrown when a WooCommerce call times out or the deadline has passed
+ */
+export const WOOCOMMERCE_TIMEOUT_ERROR = 'WooCommerce API did not respond in time';
+
+/**
+ * Computes an exponential backoff delay with full jitter
+ * @param attempt - Zero-based index of the attempt that just failed
+ * @returns Delay in milliseconds
+ */
+function getBackoffDelay(attempt: number): number {
+  return Math.random() * Math.min(RETRY_MAX_DELAY_MS, RETRY_BASE_DELAY_MS * 2 ** attempt);
+}
+
+/**
+ * Computes the delay before retrying a failed response
+ * Honours a numeric Retry-After header, otherwise uses getBackoffDelay.
+ * The server's wait is never shortened: if it asks for longer than RETRY_MAX_DELAY_MS,
+ * no retry is made.
+ * @param attempt - Zero-based index of the attempt that just failed
+ * @param response - Failed response
+ * @returns Delay in milliseconds, or null if the request should not be retried
+ */
+function getRetryDelay(attempt: number, response: Response): number | null {
+  const retryAfter = response.headers.get('retry-after');
+  if (retryAfter) {
+    const seconds = parseInt(retryAfter, 10);
+    if (!isNaN(seconds)) {
+      const delay = seconds * 1000;
+      return delay <= RETRY_MAX_DELAY_MS ? delay : null;
+    }
+  }
+
+  return getBackoffDelay(attempt);
+}
+
+/**
+ * Performs a GET request against the WooCommerce API
+ * All read paths go through this helper so request handling stays in one place.
+ * Node's fetch keeps connections alive per origin, so repeated calls reuse sockets.
+ * Network errors and 429/5xx responses are retried with backoff; GETs are idempotent.
+ * Each attempt is bounded by REQUEST_TIMEOUT_MS and by the remaining deadline, and no
+ * retry is scheduled that would end past the deadline or sooner than Retry-After allows.
+ * @param url - Full WooCommerce API URL to fetch
+ * @param authHeaders - Authentication headers for WooCommerce API
+ * @param deadline - Optional epoch time (ms) by which the call must finish
+ * @returns Fetch response (the last one received if all retries fail)
+ * @throws Error with WOOCOMMERCE_TIMEOUT_ERROR if the call times out or the deadline has passed
+ */
+export async function fetchFromWooCommerce(
+  url: string,
+  authHeaders: HeadersInit,
+  deadline?: number
+): Promise<Response> {
+  for (let attempt = 0; ; attempt++) {
+    const remaining = deadline === undefined ? REQUEST_TIMEOUT_MS : deadline - Date.now();
+    if (remaining <= 0) {
+      throw new Error(WOOCOMMERCE_TIMEOUT_ERROR);
+    }
+
+    try {
+      const response = await fetch(url, {
+        method: 'GET',
+        headers: authHeaders,
+        signal: AbortSignal.timeout(Math.min(REQUEST_TIMEOUT_MS, remaining)),
+      });
+
+      if (!RETRYABLE_STATUSES.has(response.status) || attempt >= MAX_RETRIES) {
+        return response;
+      }
+
+      const delay = getRetryDelay(attempt, response);
+      if (delay === null || (deadline !== undefined && Date.now() + delay >= deadline)) {
+        return response;
+      }
+
+      console.warn(`[WooCommerce Helper] ${url} returned ${response.status}, retrying (attempt ${attempt + 1}/${MAX_RETRIES})`);
+      await response.body?.cancel();
+      await new Promise((resolve) => setTimeout(resolve, delay));
+    } catch (error) {
+      const delay = getBackoffDelay(attempt);
+      if (attempt >= MAX_RETRIES || (deadline !== undefined && Date.now() + delay >= deadline)) {
+        if (error instanceof Error && error.name === 'TimeoutError') {
+          throw new Error(WOOCOMMERCE_TIMEOUT_ERROR);
+        }
+        throw error;
+      }
+
+      console.warn(`[WooCommerce Helper] ${url} failed, retrying (attempt ${attempt + 1}/${MAX_RETRIES}):`, error);
+      await new Promise((resolve) => setTimeout(resolve, delay));
+    }
+  }
+}
+
+/**
+ * Parses a WooCommerce API response body as JSON
+ * Checks the content-type first so HTML error pages never reach the JSON parser.
+ * The request's timeout signal still applies while the body streams in, so a timeout
+ * here is reported the same way as one raised by fetchFromWooCommerce.
+ * @param response - Fetch response returned by the WooCommerce API
+ * @returns Parsed JSON body, or null if the response is not JSON
+ * @throws Error with WOOCOMMERCE_TIMEOUT_ERROR if the body does not arrive in time
+ */
+export async function readJsonResponse(response: Response): Promise<any | null> {
+  const contentType = response.headers.get('content-type');
+  if (!contentType || !contentType.includes('application/json')) {
+    return null;
+  }
+
+  try {
+    return await response.json();
+  } catch (error) {
+    if (error instanceof Error && error.name === 'TimeoutError') {
+      throw new Error(WOOCOMMERCE_TIMEOUT_ERROR);
+    }
+    throw error;
+  }
+}
+
+/**
+ * Result of a paginated WooCommerce collection fetch
+ */
+export interface PaginatedResult {
+  ok: boolean;
+  status: number;
+  items: any[];
+}
+
+/**
+ * Fetches every page of a WooCommerce collection endpoint
+ * Sizes the loop from the X-WP-TotalPages header returned with the first page, so no
+ * extra request is spent probing past the last page. If the header is missing, keeps
+ * going while pages come back full.
+ *
+ * @param url - Collection URL including filters and per_page (page is set here)
+ * @param authHeaders - Authentication headers for WooCommerce API
+ * @param options - Optional page limit and deadline (epoch ms) passed to every page request
+ * @returns ok/status of the first page and all items collected
+ * @throws Error if a page is not JSON, or WOOCOMMERCE_TIMEOUT_ERROR if a page does not arrive in time
+ */
+export async function fetchAllPages(
+  url: URL,
+  authHeaders: HeadersInit,
+  options: { maxPages?: number; deadline?: number } = {}
+): Promise<PaginatedResult> {
+  const { maxPages, deadline } = options;
+  const perPage = parseInt(url.searchParams.get('per_page') || '10', 10);
+  // Collect whole pages and flatten once at the end instead of re-copying the
+  // accumulated items on every page
+  const pages: any[][] = [];
+  let totalPages = 1;
+
+  for (let page = 1; page <= totalPages; page++) {
+    if (maxPages !== undefined && page > maxPages) {
+      console.warn(`[WooCommerce Helper] Stopped after ${maxPages} pages of ${url.pathname} (${totalPages} available)`);
+      break;
+    }
+
+    const pageUrl = new URL(url);
+    pageUrl.searchParams.set('page', page.toString());
+
+    const response = await fetchFromWooCommerce(pageUrl.toString(), authHeaders, deadline);
+
+    if (!response.ok) {
+      if (page === 1) {
+        return { ok: false, status: response.status, items: [] };
+      }
+      // Keep what we have if a later page fails
+      break;
+    }
+
+    const pageItems = await readJsonResponse(response);
+    if (pageItems === null) {
+      throw new Error('WooCommerce API returned invalid response format');
+    }
+
+    const pageArray = Array.isArray(pageItems) ? pageItems : [pageItems];
+    if (pageArray.length === 0) {
+      break;
+    }
+
+    pages.push(pageArray);
+
+    const totalPagesHeader = response.headers.get('X-WP-TotalPages');
+    const parsedTotalPages = totalPagesHeader ? parseInt(totalPagesHeader, 10) : NaN;
+    if (!isNaN(parsedTotalPages)) {
+      totalPages = parsedTotalPages;
+    } else if (pageArray.length >= perPage) {
+      totalPages = page + 1;
+    }
+  }
+
+  return { ok: true, status: 200, items: pages.flat() };
+}
+
+/**
+ * Maximum number of concurrent WooCommerce requests issued by a single fan-out
+ */
+export const WOOCOMMERCE_FETCH_CONCURRENCY = 8;
+
+/**
+ * Runs an async worker over every item with a bounded number of in-flight calls
+ * Used for per-order and per-subscription fan-outs so one customer with many orders
+ * does not open dozens of simultaneous connections to the WooCommerce host
+ *
+ * @param items - Items to process
+ * @param limit - Maximum number of workers running at once
+ * @param worker - Async function invoked once per item
+ */
+export async function mapWithConcurrency<T>(
+  items: T[],
+  limit: number,
+  worker: (item: T) => Promise<void>
+): Promise<void> {
+  let nextIndex = 0;
+
+  const runners = Array.from({ length: Math.min(limit, items.length) }, async () => {
+    while (nextIndex < items.length) {
+      const item = items[nextIndex++];
+      await worker(item);
+    }
+  });
+
+  await Promise.all(runners);
+}
+
+/**
+ * Checks whether a WooCommerce order or subscription belongs to a customer email
+ * Uses the billing email, falling back to customer_email when billing has none (or only whitespace)
+ * @param record - Order or subscription object from the WooCommerce API
+ * @param normalizedEmail - Lowercased, trimmed email to compare against
+ * @returns True if the record's email matches
+ */
+export function recordBelongsToEmail(record: any, normalizedEmail: string): boolean {
+  const recordEmail = record.billing?.email?.toLowerCase().trim() || record.customer_email?.toLowerCase().trim();
+  return !!recordEmail && recordEmail === normalizedEmail;
+}
+
+/**
+ * Finds orders or subscriptions by email using the WooCommerce search parameter
+ * Used when no customer account matches the email (e.g. guest checkouts). The search
+ * is fuzzy across several fields, so results are narrowed to exact email matches.
+ *
+ * Failures are reported the same way as fetchAllPages, so callers can apply their own
+ * endpoint fallbacks (e.g. the Subscriptions v1 API) before giving up.
+ *
+ * @param collectionUrl - Collection endpoint URL (e.g. https://example.com/wp-json/wc/v3/orders)
+ * @param authHeaders - Authentication headers for WooCommerce API
+ * @param normalizedEmail - Lowercased, trimmed email to search for
+ * @param options - Optional page limit and deadline (epoch ms) passed to fetchAllPages
+ * @returns ok/status of the first page and the records matching the email
+ * @throws Error if a page is not JSON, or WOOCOMMERCE_TIMEOUT_ERROR if the search does not finish in time
+ */
+export async function searchRecordsByEmail(
+  collectionUrl: string,
+  authHeaders: HeadersInit,
+  normalizedEmail: string,
+  options: { maxPages?: number; deadline?: number } = {}
+): Promise<PaginatedResult> {
+  const searchUrl = new URL(collectionUrl);
+  searchUrl.searchParams.append('search', normalizedEmail);
+  searchUrl.searchParams.append('per_page', '100');
+
+  const result = await fetchAllPages(searchUrl, authHeaders, options);
+  if (!result.ok) {
+    console.error(`[WooCommerce Helper] Email search on ${searchUrl.pathname} returned ${result.status}`);
+    return result;
+  }
+
+  return { ...result, items: result.items.filter((record) => recordBelongsToEmail(record, normalizedEmail)) };
+}
+
 /**
  * Gets a WooCommerce customer by email address
  * Uses the official WooCommerce REST API customer endpoint with email filter
@@ -83,12 +371,15 @@ export function buildAuthHeaders(apiKey: string, apiSecret: string): HeadersInit
  * @param apiUrl - Normalized WooCommerce API URL (e.g., https://example.com/wp-json/wc/v3)
  * @param authHeaders - Authentication headers for WooCommerce API
  * @param email - Customer email address to search for
+ * @param deadline - Optional epoch time (ms) by which the lookup must finish
  * @returns Customer object if found, null otherwise
+ * @throws Error with WOOCOMMERCE_TIMEOUT_ERROR if the lookup does not finish in time
  */
 export async function getCustomerByEmail(
   apiUrl: string,
   authHeaders: HeadersInit,
-  email: string
+  email: string,
+  deadline?: number
 ): Promise<WooCommerceCustomer | null> {
   try {
     const normalizedEmail = email.toLowerCase().trim();
@@ -102,26 +393,19 @@ export async function getCustomerByEmail(
 
     console.log(`[WooCommerce Helper] Looking up customer by email: ${normalizedEmail}`);
 
-    const customersResponse = await fetch(customersUrl.toString(), {
-      method: 'GET',
-      headers: authHeaders,
-    });
-
-    // Check if response is JSON
-    const customersContentType = customersResponse.headers.get('content-type');
-    const isCustomersJson = customersContentType && customersContentType.includes('application/json');
+    const customersResponse = await fetchFromWooCommerce(customersUrl.toString(), authHeaders, deadline);
 
     if (!customersResponse.ok) {
       console.log(`[WooCommerce Helper] Customer lookup returned ${customersResponse.status}`);
       return null;
     }
 
-    if (!isCustomersJson) {
+    const customers = await readJsonResponse(customersResponse);
+    if (customers === null) {
       console.warn('[WooCommerce Helper] Customer endpoint returned non-JSON response');
       return null;
     }
 
-    const customers = await customersResponse.json();
     const customersArray = Array.isArray(customers) ? customers : [customers];
 
     if (customersArray.length > 0 && customersArray[0].id) {
@@ -133,6 +417,9 @@ export async function getCustomerByEmail(
     console.log(`[WooCommerce Helper] No customer found for email ${normalizedEmail}`);
     return null;
   } catch (error) {
+    if (error instanceof Error && error.message === WOOCOMMERCE_TIMEOUT_ERROR) {
+      throw error;
+    }
     console.error('[WooCommerce Helper] Error fetching customer by email:', error);
     return null;
   }
@@ -140,13 +427,11 @@ export async function getCustomerByEmail(
 
 /**
  * Gets cached WooCommerce customer ID from the database
- * @param email - Customer email address
+ * @param normalizedEmail - Customer email address, already lowercased and trimmed
  * @returns Cached customer ID if found, null otherwise
  */
-async function getCachedCustomerId(email: string): Promise<number | null> {
+async function getCachedCustomerId(normalizedEmail: string): Promise<number | null> {
   try {
-    const normalizedEmail = email.toLowerCase().trim();
-
     const appUser = await prisma.appUser.findFirst({
       where: { email: normalizedEmail },
       select: { woocommerceCustomerId: true },
@@ -166,14 +451,12 @@ async function getCachedCustomerId(email: string): Promise<number | null> {
 
 /**
  * Stores WooCommerce customer ID and name in the database for future lookups
- * @param email - Customer email address
+ * @param normalizedEmail - Customer email address, already lowercased and trimmed
  * @param customerId - WooCommerce customer ID to cache
  * @param customerName - Optional WooCommerce customer full name to cache
  */
-async function cacheCustomerId(email: string, customerId: number, customerName?: string): Promise<void> {
+async function cacheCustomerId(normalizedEmail: string, customerId: number, customerName?: string): Promise<void> {
   try {
-    const normalizedEmail = email.toLowerCase().trim();
-
     // Update the AppUser with the WooCommerce customer ID and name
     const data: { woocommerceCustomerId: number; wooCustomerName?: string } = {
       woocommerceCustomerId: customerId,
@@ -210,12 +493,15 @@ async function cacheCustomerId(email: string, customerId: number, customerName?:
  * @param apiUrl - Normalized WooCommerce API URL
  * @param authHeaders - Authentication headers for WooCommerce API
  * @param email - Customer email address
+ * @param deadline - Optional epoch time (ms) by which the lookup must finish
  * @returns Customer object if found, null otherwise
+ * @throws Error with WOOCOMMERCE_TIMEOUT_ERROR if the lookup does not finish in time
  */
 export async function getCustomerByEmailCached(
   apiUrl: string,
   authHeaders: HeadersInit,
-  email: string
+  email: string,
+  deadline?: number
 ): Promise<WooCommerceCustomer | null> {
   const normalizedEmail = email.toLowerCase().trim();
 
@@ -227,15 +513,11 @@ export async function getCustomerByEmailCached(
     console.log(`[WooCommerce Helper] Using cached customer ID ${cachedCustomerId}`);
 
     try {
-      const customerByIdResponse = await fetch(`${apiUrl}/customers/${cachedCustomerId}`, {
-        method: 'GET',
-        headers: authHeaders,
-      });
+      const customerByIdResponse = await fetchFromWooCommerce(`${apiUrl}/customers/${cachedCustomerId}`, authHeaders, deadline);
 
       if (customerByIdResponse.ok) {
-        const contentType = customerByIdResponse.headers.get('content-type');
-        if (contentType && contentType.includes('application/json')) {
-          const customer = await customerByIdResponse.json();
+        const customer = await readJsonResponse(customerByIdResponse);
+        if (customer !== null) {
           console.log(`[WooCommerce Helper] Retrieved customer ${cachedCustomerId} from cache`);
           return customer;
         }
@@ -249,14 +531,124 @@ export async function getCustomerByEmailCached(
         });
       }
     } catch (error) {
+      if (error instanceof Error && error.message === WOOCOMMERCE_TIMEOUT_ERROR) {
+        throw error;
+      }
       console.error('[WooCommerce Helper] Error fetching customer by cached ID:', error);
     }
   }
 
   // Step 2: Fall back to email lookup via WooCommerce API
-  const customer = await getCustomerByEmail(apiUrl, authHeaders, normalizedEmail);
+  return lookupAndCacheCustomer(apiUrl, authHeaders, normalizedEmail, deadline);
+}
+
+/**
+ * Result of a cached customer ID lookup
+ */
+export interface CustomerIdLookup {
+  customerId: number | null;
+  fromCache: boolean;
+}
+
+/**
+ * Gets a WooCommerce customer ID by email with database caching
+ *
+ * Unlike getCustomerByEmailCached, a cached ID is returned straight from the database
+ * without re-fetching the customer from WooCommerce. Callers that only need the ID to
+ * filter orders/subscriptions save a full round trip before their first data request.
+ * The cached ID is not validated here: if the customer was deleted or merged, the
+ * filtered request comes back empty, and callers should then check it with
+ * validateCachedCustomerId.
+ *
+ * @param apiUrl - Normalized WooCommerce API URL
+ * @param authHeaders - Authentication headers for WooCommerce API
+ * @param email - Customer email address
+ * @param deadline - Optional epoch time (ms) by which the lookup must finish
+ * @returns Customer ID (null if not found) and whether it came from the database cache
+ */
+export async function getCustomerIdByEmailCached(
+  apiUrl: string,
+  authHeaders: HeadersInit,
+  email: string,
+  deadline?: number
+): Promise<CustomerIdLookup> {
+  const normalizedEmail = email.toLowerCase().trim();
+
+  const cachedCustomerId = await getCachedCustomerId(normalizedEmail);
+  if (cachedCustomerId) {
+    return { customerId: cachedCustomerId, fromCache: true };
+  }
+
+  const customer = await lookupAndCacheCustomer(apiUrl, authHeaders, normalizedEmail, deadline);
+  return { customerId: customer?.id ?? null, fromCache: false };
+}
+
+/**
+ * Checks a cached WooCommerce customer ID that returned an empty orders/subscriptions list
+ * The ID is kept unless WooCommerce reports the customer as missing (404), so an
+ * empty list for an existing customer costs one GET and no database writes.
+ * On a 404 the cached ID is cleared and the customer is looked up again by email.
+ *
+ * @param apiUrl - Normalized WooCommerce API URL
+ * @param authHeaders - Authentication headers for WooCommerce API
+ * @param email - Customer email address
+ * @param customerId - Cached customer ID to check
+ * @param deadline - Optional epoch time (ms) by which the check must finish
+ * @returns The customer ID to use, or null if no customer matches the email
+ * @throws Error if the customer request fails with anything other than a 404
+ */
+export async function validateCachedCustomerId(
+  apiUrl: string,
+  authHeaders: HeadersInit,
+  email: string,
+  customerId: number,
+  deadline?: number
+): Promise<number | null> {
+  const customerResponse = await fetchFromWooCommerce(`${apiUrl}/customers/${customerId}`, authHeaders, deadline);
+
+  if (customerResponse.ok) {
+    await customerResponse.body?.cancel();
+    return customerId;
+  }
+
+  if (customerResponse.status !== 404) {
+    throw new Error(`WooCommerce API returned ${customerResponse.status}`);
+  }
+
+  const normalizedEmail = email.toLowerCase().trim();
+
+  // Customer ID no longer valid in WooCommerce - clear the cache and look it up again
+  console.log(`[WooCommerce Helper] Cached customer ID ${customerId} not found in WooCommerce, clearing cache`);
+  try {
+    await prisma.appUser.updateMany({
+      where: { email: normalizedEmail, woocommerceCustomerId: customerId },
+      data: { woocommerceCustomerId: null },
+    });
+  } catch (error) {
+    console.error('[WooCommerce Helper] Error clearing cached customer ID:', error);
+  }
+
+  const customer = await lookupAndCacheCustomer(apiUrl, authHeaders, normalizedEmail, deadline);
+  return customer?.id ?? null;
+}
+
+/**
+ * Looks up a WooCommerce customer by email and caches the ID and name if found
+ * @param apiUrl - Normalized WooCommerce API URL
+ * @param authHeaders - Authentication headers for WooCommerce API
+ * @param normalizedEmail - Customer email address, already lowercased and trimmed
+ * @param deadline - Optional epoch time (ms) by which the lookup must finish
+ * @returns Customer object if found, null otherwise
+ */
+async function lookupAndCacheCustomer(
+  apiUrl: string,
+  authHeaders: HeadersInit,
+  normalizedEmail: string,
+  deadline?: number
+): Promise<WooCommerceCustomer | null> {
+  const customer = await getCustomerByEmail(apiUrl, authHeaders, normalizedEmail, deadline);
 
-  // Step 3: Cache the customer ID and name if found
+  // Cache the customer ID and name if found
   if (customer?.id) {
     // Get name from billing details, fallback to shipping
     const fullName =